@@ -1,15 +1,20 @@
 import argparse
 import os
+import sys
 import torch
-import logging
 from models.sana import get_sana
 from models.hidream import get_hidream
 from prompt.loader import read_prompt_csv
-from prompt.generate import generate_image
+from prompt.generate import (
+    generate_image,
+    encode_prompt,
+    denoise_latents,
+    decode_latents,
+)
 from utils.logger import setup_logger
 from utils.misc import get_device, get_dtype
 from utils.grid import create_grid_image
-from PIL import Image
+from utils.stages import Stage, StagedExecutor
 
 CATEGORY_LIST = [
     "Colors",
@@ -65,6 +70,14 @@ AVAILABLE_MODELS = {
     },
 }
 
+
+def positive_int(value: str) -> int:
+    ivalue = int(value)
+    if ivalue < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer, got {value}")
+    return ivalue
+
+
 parser = argparse.ArgumentParser(description="Prompt Loader")
 parser.add_argument(
     "-v", "--verbose", action="store_true", help="Enable verbose output"
@@ -153,6 +166,148 @@ parser.add_argument(
     default=42,
     help="Random seed for reproducibility",
 )
+# pipelined execution
+parser.add_argument(
+    "--pipelined",
+    action="store_true",
+    help="Overlap text encoding, denoising, decoding and saving across prompts",
+)
+parser.add_argument(
+    "--queue_size",
+    type=positive_int,
+    default=2,
+    help="Capacity of each queue between stages (only with --pipelined)",
+)
+
+
+def get_image_path(category_dir: str, prompt: str, seed: int) -> str:
+    # 프롬프트를 파일명으로 사용하여 이미지 저장 (최대 24글자로 제한)
+    cleaned_prompt = (
+        prompt.replace(" ", "_")
+        .replace(".", "")
+        .replace(",", "")
+        .replace("!", "")
+        .replace("?", "")
+    )
+    if len(cleaned_prompt) > 24:
+        cleaned_prompt = cleaned_prompt[:24]
+    image_filename = f"{cleaned_prompt}_seed{seed}.png"
+    return os.path.join(category_dir, image_filename)
+
+
+def save_grid_image(args, model_dir, category, images, prompts, logger):
+    logger.info("Creating grid image for category '%s'", category)
+    grid_filename = f"{category}_grid.png"
+    grid_path = os.path.join(model_dir, grid_filename)
+
+    try:
+        create_grid_image(
+            images=images,
+            prompts=prompts,
+            category=category,
+            rows=args.grid_rows,
+            output_path=grid_path,
+            title_size=args.title_size,
+            prompt_size=args.prompt_size,
+            title_font_size=args.title_font_size,
+            prompt_font_size=args.prompt_font_size,
+        )
+        logger.info("Grid image saved: %s", grid_path)
+    except Exception as e:
+        logger.error("Error creating grid image: %s", str(e))
+
+
+def run_pipelined(
+    *, args, pipeline, configs, generator, device, selected_prompts, model_dir, logger
+) -> int:
+    """
+    prompt loading -> encode -> denoise -> decode -> save 단계를 스레드로 분리하여
+    다음 프롬프트의 텍스트 인코딩이 현재 프롬프트의 디노이징과 겹치도록 실행합니다.
+
+    Returns:
+        저장된 이미지 수
+    """
+    category_images = {}
+    category_prompts = {}
+
+    def load_prompts():
+        for category, prompts in selected_prompts.items():
+            category_dir = os.path.join(model_dir, category)
+            os.makedirs(category_dir, exist_ok=True)
+            if not args.no_grid:
+                category_images[category] = []
+                category_prompts[category] = []
+            logger.info("Queueing %d prompts for category '%s'", len(prompts), category)
+            for prompt in prompts:
+                yield {"category": category, "prompt": prompt}
+
+    def encode(item):
+        logger.info("Encoding prompt '%s'...", item["prompt"])
+        item["embeds"] = encode_prompt(pipeline, item["prompt"], configs)
+        return item
+
+    def denoise(item):
+        logger.info("Generating image with prompt '%s'...", item["prompt"])
+        # 생성기는 이 단계에서만 사용되므로 순차 실행과 같은 시드 순서가 유지됩니다
+        item["latents"] = denoise_latents(
+            pipeline, item.pop("embeds"), configs, generator
+        )
+        return item
+
+    def decode(item):
+        item["image"] = decode_latents(pipeline, item.pop("latents"), configs)
+        return item
+
+    def save(item):
+        category, prompt, image = item["category"], item["prompt"], item["image"]
+        image_path = get_image_path(
+            os.path.join(model_dir, category), prompt, args.seed
+        )
+        image.save(image_path)
+        if not args.no_grid:
+            category_images[category].append(image)
+            category_prompts[category].append(prompt)
+        logger.info("Image saved: %s", image_path)
+
+    executor = StagedExecutor(
+        stages=[
+            Stage("encode", encode, use_stream=True),
+            Stage("denoise", denoise, use_stream=True),
+            Stage("decode", decode, use_stream=True),
+            Stage("save", save),
+        ],
+        queue_size=args.queue_size,
+        device=device,
+        label=lambda item: f"prompt '{item['prompt']}'",
+    )
+    num_saved = executor.run(load_prompts())
+    executor.log_occupancy()
+
+    dropped = {
+        name: stats["dropped"]
+        for name, stats in executor.occupancy().items()
+        if stats["dropped"]
+    }
+    if dropped:
+        logger.error(
+            "%d images saved, failed prompts per stage: %s",
+            num_saved,
+            ", ".join(f"{name}={count}" for name, count in dropped.items()),
+        )
+
+    for category, images in category_images.items():
+        if images:
+            save_grid_image(
+                args=args,
+                model_dir=model_dir,
+                category=category,
+                images=images,
+                prompts=category_prompts[category],
+                logger=logger,
+            )
+
+    return num_saved
+
 
 if __name__ == "__main__":
     args = parser.parse_args()
@@ -230,83 +385,80 @@ if __name__ == "__main__":
     # 기본 출력 디렉토리 생성
     os.makedirs(args.output_dir, exist_ok=True)
 
-    # 그리드 생성용 이미지 저장
-    category_images = {}
-    category_prompts = {}
+    # 디렉토리 구조: {model_name}/{category}/
+    model_dir = os.path.join(args.output_dir, model_name)
+
+    if args.pipelined:
+        num_saved = run_pipelined(
+            args=args,
+            pipeline=pipeline,
+            configs=configs,
+            generator=generator,
+            device=device,
+            selected_prompts=selected_prompts,
+            model_dir=model_dir,
+            logger=logger,
+        )
+    else:
+        num_saved = 0
+        # 그리드 생성용 이미지 저장
+        category_images = {}
+        category_prompts = {}
 
-    # 각 카테고리별 이미지 생성
-    for category, prompts in selected_prompts.items():
-        # 디렉토리 구조 생성: {model_name}/{category}/
-        model_dir = os.path.join(args.output_dir, model_name)
-        category_dir = os.path.join(model_dir, category)
-        os.makedirs(category_dir, exist_ok=True)
+        # 각 카테고리별 이미지 생성
+        for category, prompts in selected_prompts.items():
+            category_dir = os.path.join(model_dir, category)
+            os.makedirs(category_dir, exist_ok=True)
 
-        logger.info("Starting image generation for category '%s'", category)
+            logger.info("Starting image generation for category '%s'", category)
 
-        # 그리드 생성용 리스트 초기화
-        if not args.no_grid:
-            category_images[category] = []
-            category_prompts[category] = []
-
-        for i, prompt in enumerate(prompts):
-            logger.info("Generating image with prompt '%s'...", prompt)
-
-            try:
-                # 이미지 생성
-                image = generate_image(pipeline, prompt, configs, generator)
-
-                # 프롬프트를 파일명으로 사용하여 이미지 저장
-                # 프롬프트를 파일명으로 사용하여 이미지 저장 (최대 24글자로 제한)
-                cleaned_prompt = (
-                    prompt.replace(" ", "_")
-                    .replace(".", "")
-                    .replace(",", "")
-                    .replace("!", "")
-                    .replace("?", "")
-                )
-                if len(cleaned_prompt) > 24:
-                    cleaned_prompt = cleaned_prompt[:24]
-                image_filename = f"{cleaned_prompt}_seed{args.seed}.png"
-                image_path = os.path.join(category_dir, image_filename)
-                image.save(image_path)
-
-                # 그리드 생성용으로 저장
-                if not args.no_grid:
-                    category_images[category].append(image)
-                    category_prompts[category].append(prompt)
-
-                logger.info("Image saved: %s", image_path)
-            except Exception as e:
-                logger.error("Error generating image: %s", str(e))
-
-        logger.info("Completed image generation for category '%s'", category)
-
-        # 그리드 이미지 생성 (--no_grid 옵션이 지정되지 않은 경우)
-        if (
-            not args.no_grid
-            and category in category_images
-            and category_images[category]
-        ):
-            logger.info("Creating grid image for category '%s'", category)
-            grid_filename = f"{category}_grid.png"
-            grid_path = os.path.join(model_dir, grid_filename)
-
-            try:
-                create_grid_image(
+            # 그리드 생성용 리스트 초기화
+            if not args.no_grid:
+                category_images[category] = []
+                category_prompts[category] = []
+
+            for i, prompt in enumerate(prompts):
+                logger.info("Generating image with prompt '%s'...", prompt)
+
+                try:
+                    # 이미지 생성
+                    image = generate_image(pipeline, prompt, configs, generator)
+
+                    # 프롬프트를 파일명으로 사용하여 이미지 저장
+                    image_path = get_image_path(category_dir, prompt, args.seed)
+                    image.save(image_path)
+
+                    # 그리드 생성용으로 저장
+                    if not args.no_grid:
+                        category_images[category].append(image)
+                        category_prompts[category].append(prompt)
+
+                    logger.info("Image saved: %s", image_path)
+                    num_saved += 1
+                except Exception as e:
+                    logger.error("Error generating image: %s", str(e))
+
+            logger.info("Completed image generation for category '%s'", category)
+
+            # 그리드 이미지 생성 (--no_grid 옵션이 지정되지 않은 경우)
+            if (
+                not args.no_grid
+                and category in category_images
+                and category_images[category]
+            ):
+                save_grid_image(
+                    args=args,
+                    model_dir=model_dir,
+                    category=category,
                     images=category_images[category],
                     prompts=category_prompts[category],
-                    category=category,
-                    rows=args.grid_rows,
-                    output_path=grid_path,
-                    title_size=args.title_size,
-                    prompt_size=args.prompt_size,
-                    title_font_size=args.title_font_size,
-                    prompt_font_size=args.prompt_font_size,
+                    logger=logger,
                 )
-                logger.info("Grid image saved: %s", grid_path)
-            except Exception as e:
-                logger.error("Error creating grid image: %s", str(e))
 
     # 모든 카테고리 처리 완료
+    num_prompts = sum(map(len, selected_prompts.values()))
+    if num_prompts and num_saved == 0:
+        logger.error("No images were generated out of %d prompts", num_prompts)
+        sys.exit(1)
 
     logger.info("All processing completed")
@@ -1,6 +1,11 @@
+import inspect
 import logging
-from diffusers import DiffusionPipeline
-from typing import Union, Dict
+from diffusers import (
+    DiffusionPipeline,
+    HiDreamImagePipeline,
+    SanaPipeline,
+    SanaSprintPipeline,
+)
 from PIL import Image
 import torch
 
@@ -8,7 +13,7 @@ import torch
 def generate_image(
     pipeline: DiffusionPipeline,
     prompt: str,
-    configs: Dict[str, Union[str, int, float]],
+    configs: dict[str, str | int | float],
     generator: torch.Generator,
 ) -> Image.Image:
     logger = logging.getLogger(__name__)
@@ -20,3 +25,156 @@ def generate_image(
     ).images[0]
     logger.debug("Image generated successfully.")
     return image
+
+
+def _call_default(pipeline: DiffusionPipeline, name: str):
+    """Default value of a __call__ argument, so split stages match generate_image."""
+    return inspect.signature(pipeline.__call__).parameters[name].default
+
+
+def _encoder_args(pipeline: DiffusionPipeline) -> list[str]:
+    """
+    __call__ arguments that __call__ only forwards to encode_prompt
+    (negative_prompt, max_sequence_length, clean_caption, ...).
+    """
+    encode_params = inspect.signature(pipeline.encode_prompt).parameters
+    call_params = inspect.signature(pipeline.__call__).parameters
+    return [
+        name
+        for name in encode_params
+        if name in call_params
+        and name not in ("self", "prompt", "num_images_per_prompt")
+        and "embeds" not in name
+        and "attention_mask" not in name
+    ]
+
+
+@torch.no_grad()
+def encode_prompt(
+    pipeline: DiffusionPipeline,
+    prompt: str,
+    configs: dict[str, str | int | float],
+) -> dict[str, torch.Tensor]:
+    """
+    Run only the text encoder(s) of the pipeline.
+
+    Encoder settings in configs (e.g. negative_prompt, max_sequence_length) are
+    applied here; denoise_latents leaves them out of the pipeline call.
+
+    Returns:
+        Keyword arguments that replace `prompt` when calling the pipeline
+    """
+    guidance_scale = configs.get(
+        "guidance_scale", _call_default(pipeline, "guidance_scale")
+    )
+    do_classifier_free_guidance = guidance_scale > 1.0
+
+    encoder_kwargs = {
+        name: configs.get(name, _call_default(pipeline, name))
+        for name in _encoder_args(pipeline)
+    }
+    if "num_images_per_prompt" in configs:
+        encoder_kwargs["num_images_per_prompt"] = configs["num_images_per_prompt"]
+
+    if isinstance(pipeline, SanaSprintPipeline):
+        prompt_embeds, prompt_attention_mask = pipeline.encode_prompt(
+            prompt,
+            device=pipeline._execution_device,
+            **encoder_kwargs,
+        )
+        return {
+            "prompt_embeds": prompt_embeds,
+            "prompt_attention_mask": prompt_attention_mask,
+        }
+
+    if isinstance(pipeline, SanaPipeline):
+        (
+            prompt_embeds,
+            prompt_attention_mask,
+            negative_prompt_embeds,
+            negative_prompt_attention_mask,
+        ) = pipeline.encode_prompt(
+            prompt,
+            do_classifier_free_guidance=do_classifier_free_guidance,
+            device=pipeline._execution_device,
+            **encoder_kwargs,
+        )
+        return {
+            "prompt_embeds": prompt_embeds,
+            "prompt_attention_mask": prompt_attention_mask,
+            "negative_prompt_embeds": negative_prompt_embeds,
+            "negative_prompt_attention_mask": negative_prompt_attention_mask,
+        }
+
+    if isinstance(pipeline, HiDreamImagePipeline):
+        (
+            prompt_embeds_t5,
+            negative_prompt_embeds_t5,
+            prompt_embeds_llama3,
+            negative_prompt_embeds_llama3,
+            pooled_prompt_embeds,
+            negative_pooled_prompt_embeds,
+        ) = pipeline.encode_prompt(
+            prompt=prompt,
+            device=pipeline._execution_device,
+            do_classifier_free_guidance=do_classifier_free_guidance,
+            **encoder_kwargs,
+        )
+        return {
+            "prompt_embeds_t5": prompt_embeds_t5,
+            "negative_prompt_embeds_t5": negative_prompt_embeds_t5,
+            "prompt_embeds_llama3": prompt_embeds_llama3,
+            "negative_prompt_embeds_llama3": negative_prompt_embeds_llama3,
+            "pooled_prompt_embeds": pooled_prompt_embeds,
+            "negative_pooled_prompt_embeds": negative_pooled_prompt_embeds,
+        }
+
+    raise ValueError(f"Unsupported pipeline: {type(pipeline).__name__}")
+
+
+def denoise_latents(
+    pipeline: DiffusionPipeline,
+    prompt_embeds: dict[str, torch.Tensor],
+    configs: dict[str, str | int | float],
+    generator: torch.Generator,
+) -> torch.Tensor:
+    """Run the denoising loop on precomputed embeddings and return the latents."""
+    encoder_args = _encoder_args(pipeline)
+    configs = {k: v for k, v in configs.items() if k not in encoder_args}
+    if prompt_embeds.get("negative_prompt_embeds") is not None:
+        # SANA의 기본 negative_prompt("")는 negative_prompt_embeds와 함께 줄 수 없습니다
+        prompt_embeds = {**prompt_embeds, "negative_prompt": None}
+
+    latents = pipeline(
+        generator=generator,
+        output_type="latent",
+        **prompt_embeds,
+        **configs,
+    ).images
+    return latents
+
+
+@torch.no_grad()
+def decode_latents(
+    pipeline: DiffusionPipeline,
+    latents: torch.Tensor,
+    configs: dict[str, str | int | float],
+) -> Image.Image:
+    """Decode latents from denoise_latents into a PIL image."""
+    vae = pipeline.vae
+    latents = latents.to(vae.dtype) / vae.config.scaling_factor
+    shift_factor = getattr(vae.config, "shift_factor", None)
+    if shift_factor is not None:
+        latents = latents + shift_factor
+
+    image = vae.decode(latents, return_dict=False)[0]
+
+    # SANA는 해상도 bin 크기로 생성한 뒤 요청한 크기로 되돌립니다
+    if isinstance(pipeline, (SanaPipeline, SanaSprintPipeline)) and configs.get(
+        "use_resolution_binning", _call_default(pipeline, "use_resolution_binning")
+    ):
+        height = configs.get("height", _call_default(pipeline, "height"))
+        width = configs.get("width", _call_default(pipeline, "width"))
+        image = pipeline.image_processor.resize_and_crop_tensor(image, width, height)
+
+    return pipeline.image_processor.postprocess(image, output_type="pil")[0]
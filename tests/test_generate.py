@@ -0,0 +1,142 @@
+import numpy as np
+import pytest
+import torch
+from diffusers import (
+    AutoencoderDC,
+    DPMSolverMultistepScheduler,
+    SanaPipeline,
+    SanaSprintPipeline,
+    SanaTransformer2DModel,
+    SCMScheduler,
+)
+from tokenizers import Tokenizer, models, pre_tokenizers
+from transformers import Gemma2Config, Gemma2Model, PreTrainedTokenizerFast
+
+from prompt.generate import (
+    decode_latents,
+    denoise_latents,
+    encode_prompt,
+    generate_image,
+)
+
+PROMPT = "a red car on the road"
+
+
+def _tokenizer():
+    words = ["<pad>", "<unk>", "<bos>", "<eos>"] + PROMPT.split()
+    tokenizer = Tokenizer(
+        models.WordLevel({w: i for i, w in enumerate(words)}, unk_token="<unk>")
+    )
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    return PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        pad_token="<pad>",
+        unk_token="<unk>",
+        bos_token="<bos>",
+        eos_token="<eos>",
+    )
+
+
+def _tiny_sana(pipeline_cls):
+    """Randomly initialized SANA pipeline small enough to run on CPU."""
+    torch.manual_seed(0)
+    text_encoder = Gemma2Model(
+        Gemma2Config(
+            vocab_size=16,
+            hidden_size=8,
+            intermediate_size=16,
+            num_hidden_layers=1,
+            num_attention_heads=2,
+            num_key_value_heads=1,
+            head_dim=4,
+        )
+    )
+    transformer_kwargs = {}
+    if pipeline_cls is SanaSprintPipeline:
+        transformer_kwargs = {
+            "guidance_embeds": True,
+            "qk_norm": "rms_norm_across_heads",
+        }
+    transformer = SanaTransformer2DModel(
+        patch_size=1,
+        in_channels=4,
+        out_channels=4,
+        num_layers=1,
+        num_attention_heads=2,
+        attention_head_dim=4,
+        num_cross_attention_heads=2,
+        cross_attention_head_dim=4,
+        cross_attention_dim=8,
+        caption_channels=8,
+        sample_size=32,
+        **transformer_kwargs,
+    )
+    vae = AutoencoderDC(
+        in_channels=3,
+        latent_channels=4,
+        attention_head_dim=2,
+        encoder_block_types=("ResBlock", "EfficientViTBlock"),
+        decoder_block_types=("ResBlock", "EfficientViTBlock"),
+        encoder_block_out_channels=(8, 8),
+        decoder_block_out_channels=(8, 8),
+        encoder_qkv_multiscales=((), (5,)),
+        decoder_qkv_multiscales=((), (5,)),
+        encoder_layers_per_block=(1, 1),
+        decoder_layers_per_block=(1, 1),
+        downsample_block_type="conv",
+        upsample_block_type="interpolate",
+        decoder_norm_types="rms_norm",
+        decoder_act_fns="silu",
+        scaling_factor=0.41407,
+    )
+    if pipeline_cls is SanaSprintPipeline:
+        scheduler = SCMScheduler()
+    else:
+        scheduler = DPMSolverMultistepScheduler()
+    return pipeline_cls(
+        tokenizer=_tokenizer(),
+        text_encoder=text_encoder,
+        vae=vae,
+        transformer=transformer,
+        scheduler=scheduler,
+    )
+
+
+@pytest.mark.parametrize(
+    "pipeline_cls, configs",
+    [
+        (SanaPipeline, {"num_inference_steps": 2, "guidance_scale": 4.5}),
+        (SanaSprintPipeline, {"num_inference_steps": 2}),
+        # 인코더 설정은 encode_prompt 단계에서 적용되어야 합니다
+        (
+            SanaPipeline,
+            {
+                "num_inference_steps": 2,
+                "guidance_scale": 4.5,
+                "negative_prompt": "a blue dog",
+                "max_sequence_length": 8,
+                "complex_human_instruction": None,
+            },
+        ),
+        (
+            SanaSprintPipeline,
+            {"num_inference_steps": 2, "max_sequence_length": 8},
+        ),
+    ],
+)
+def test_split_stages_match_generate_image(pipeline_cls, configs):
+    pipeline = _tiny_sana(pipeline_cls)
+    configs = {**configs, "height": 64, "width": 64}
+
+    expected = generate_image(
+        pipeline, PROMPT, configs, torch.Generator().manual_seed(42)
+    )
+
+    embeds = encode_prompt(pipeline, PROMPT, configs)
+    latents = denoise_latents(
+        pipeline, embeds, configs, torch.Generator().manual_seed(42)
+    )
+    image = decode_latents(pipeline, latents, configs)
+
+    assert image.size == expected.size == (64, 64)
+    np.testing.assert_array_equal(np.asarray(image), np.asarray(expected))
@@ -0,0 +1,131 @@
+import time
+
+import pytest
+
+from utils.stages import Stage, StagedExecutor
+
+
+def _sleep(seconds):
+    def fn(item):
+        time.sleep(seconds)
+        return item
+
+    return fn
+
+
+def test_items_come_out_in_order():
+    out = []
+    executor = StagedExecutor(
+        [Stage("double", lambda x: x * 2), Stage("save", out.append)],
+        queue_size=1,
+        device="cpu",
+    )
+    assert executor.run(range(20)) == 20
+    assert out == [x * 2 for x in range(20)]
+
+
+def test_failing_item_is_dropped_and_counted():
+    out = []
+
+    def fail_on_three(x):
+        if x == 3:
+            raise RuntimeError("bad item")
+        return x
+
+    executor = StagedExecutor(
+        [Stage("check", fail_on_three), Stage("save", out.append)],
+        device="cpu",
+    )
+    assert executor.run(range(6)) == 5
+    assert out == [0, 1, 2, 4, 5]
+
+    stats = executor.occupancy()
+    assert stats["check"]["dropped"] == 1
+    assert stats["save"]["dropped"] == 0
+
+
+def test_stage_failing_every_item_completes_nothing():
+    def fail(x):
+        raise RuntimeError("always")
+
+    executor = StagedExecutor(
+        [Stage("encode", fail), Stage("save", lambda x: x)], device="cpu"
+    )
+    assert executor.run(range(4)) == 0
+    assert executor.occupancy()["encode"]["dropped"] == 4
+
+
+@pytest.mark.parametrize("queue_size", [0, -1])
+def test_invalid_queue_size(queue_size):
+    with pytest.raises(ValueError):
+        StagedExecutor([Stage("save", lambda x: x)], queue_size=queue_size)
+
+
+def test_no_stages():
+    with pytest.raises(ValueError):
+        StagedExecutor([])
+
+
+@pytest.mark.parametrize("queue_size", [1, 2])
+def test_occupancy_points_at_bottleneck(queue_size):
+    executor = StagedExecutor(
+        [
+            Stage("encode", lambda x: x),
+            Stage("denoise", _sleep(0.02)),
+            Stage("decode", lambda x: x),
+            Stage("save", lambda x: x),
+        ],
+        queue_size=queue_size,
+        device="cpu",
+    )
+    executor.run(range(10))
+
+    stats = executor.occupancy()
+    assert list(stats) == ["encode", "denoise", "decode", "save"]
+    for stage_stats in stats.values():
+        assert stage_stats["maxsize"] == queue_size
+        assert stage_stats["current"] == 0
+        assert 0 <= stage_stats["mean"] <= stage_stats["peak"] <= queue_size
+
+    # 느린 denoise 앞의 큐는 가득 차고, 그 뒤의 큐는 비어 있어야 합니다
+    assert stats["denoise"]["mean"] > queue_size / 2
+    assert stats["decode"]["mean"] < 0.2
+    assert stats["save"]["mean"] < 0.2
+
+    assert executor.bottleneck() == "denoise"
+    assert stats["encode"]["wait_put"] > stats["encode"]["busy"]
+    assert stats["decode"]["wait_get"] > stats["decode"]["busy"]
+
+
+def test_error_log_names_item(caplog):
+    def fail(item):
+        raise RuntimeError("boom")
+
+    executor = StagedExecutor(
+        [Stage("encode", fail)],
+        device="cpu",
+        label=lambda item: item["prompt"],
+    )
+    executor.run([{"prompt": "A red colored car."}])
+
+    assert "A red colored car." in caplog.text
+    assert "encode" in caplog.text
+
+
+def test_stages_overlap():
+    num_items, delay = 8, 0.05
+    executor = StagedExecutor(
+        [
+            Stage("encode", _sleep(delay)),
+            Stage("denoise", _sleep(delay)),
+            Stage("decode", _sleep(delay)),
+        ],
+        device="cpu",
+    )
+
+    start = time.perf_counter()
+    executor.run(range(num_items))
+    elapsed = time.perf_counter() - start
+
+    serial = num_items * 3 * delay
+    assert elapsed < serial * 0.75
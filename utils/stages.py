@@ -0,0 +1,264 @@
+import logging
+import queue
+import threading
+import time
+from collections.abc import Callable, Iterable
+from typing import Any
+
+import torch
+
+_STOP = object()
+
+
+class Stage:
+    """
+    A single step of a StagedExecutor.
+
+    Args:
+        name: Stage name used for logging and occupancy stats
+        fn: Callable taking one item and returning the item for the next stage
+        use_stream: Run this stage on its own CUDA stream (ignored on CPU)
+    """
+
+    def __init__(self, name: str, fn: Callable[[Any], Any], use_stream: bool = False):
+        self.name = name
+        self.fn = fn
+        self.use_stream = use_stream
+
+
+class _StageStats:
+    """
+    Queue occupancy and timings of one stage.
+
+    Occupancy is sampled by the worker just before it takes the next item, so
+    a starved stage reads 0 and a stage that can't keep up reads maxsize.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.samples = 0
+        self.total = 0
+        self.peak = 0
+        self.dropped = 0
+        self.busy = 0.0
+        self.wait_get = 0.0
+        self.wait_put = 0.0
+        self.lock = threading.Lock()
+
+    def sample(self, size: int):
+        with self.lock:
+            self.samples += 1
+            self.total += size
+            self.peak = max(self.peak, size)
+
+    def add(self, name: str, seconds: float):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + seconds)
+
+    def drop(self):
+        with self.lock:
+            self.dropped += 1
+
+    def as_dict(self, current: int) -> dict[str, float]:
+        with self.lock:
+            mean = self.total / self.samples if self.samples else 0.0
+            return {
+                "current": current,
+                "peak": self.peak,
+                "mean": mean,
+                "maxsize": self.maxsize,
+                "dropped": self.dropped,
+                "busy": self.busy,
+                "wait_get": self.wait_get,
+                "wait_put": self.wait_put,
+            }
+
+
+def _record_stream(obj: Any, stream: "torch.cuda.Stream"):
+    """Mark every tensor in obj as used on stream so the allocator won't reuse it early."""
+    if isinstance(obj, torch.Tensor):
+        if obj.is_cuda:
+            obj.record_stream(stream)
+    elif isinstance(obj, dict):
+        for value in obj.values():
+            _record_stream(value, stream)
+    elif isinstance(obj, (list, tuple)):
+        for value in obj:
+            _record_stream(value, stream)
+
+
+class StagedExecutor:
+    """
+    Run items through a chain of stages, one worker thread per stage, with a
+    bounded queue in front of each stage.
+
+    While stage N works on item i, stage N-1 can already work on item i+1, so
+    e.g. text encoding of the next prompt overlaps denoising of the current
+    one. On CUDA, stages created with use_stream=True run on their own stream
+    and hand results over with an event, so their kernels can overlap too.
+
+    Items are processed in order. If a stage raises, the error is logged with
+    the item's label and the item is dropped and counted; the remaining items
+    keep flowing.
+
+    Args:
+        stages: Stages in execution order
+        queue_size: Capacity of each inter-stage queue
+        device: Device the stages run on (streams are only used for CUDA)
+        label: Callable naming an item in error logs (defaults to repr)
+    """
+
+    def __init__(
+        self,
+        stages: list[Stage],
+        queue_size: int = 2,
+        device: torch.device | None = None,
+        label: Callable[[Any], str] = repr,
+    ):
+        if not stages:
+            raise ValueError("At least one stage is required")
+        if queue_size < 1:
+            raise ValueError(f"queue_size must be positive, got {queue_size}")
+
+        self.stages = stages
+        self.queue_size = queue_size
+        self.device = torch.device(device) if device is not None else None
+        self.label = label
+        self.logger = logging.getLogger(__name__)
+
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self._stats = [_StageStats(queue_size) for _ in stages]
+        self._completed = 0
+
+    def _use_streams(self) -> bool:
+        return (
+            self.device is not None
+            and self.device.type == "cuda"
+            and torch.cuda.is_available()
+        )
+
+    def _worker(self, index: int):
+        stage = self.stages[index]
+        inbox = self._queues[index]
+        stats = self._stats[index]
+        is_last = index == len(self.stages) - 1
+
+        stream = None
+        if stage.use_stream and self._use_streams():
+            stream = torch.cuda.Stream(device=self.device)
+
+        while True:
+            size = inbox.qsize()
+            start = time.perf_counter()
+            payload = inbox.get()
+            if payload is _STOP:
+                if not is_last:
+                    self._queues[index + 1].put(_STOP)
+                break
+            stats.add("wait_get", time.perf_counter() - start)
+            stats.sample(size)
+
+            item, ready = payload
+            start = time.perf_counter()
+            try:
+                if stream is not None:
+                    if ready is not None:
+                        stream.wait_event(ready)
+                    _record_stream(item, stream)
+                    with torch.cuda.stream(stream):
+                        result = stage.fn(item)
+                        ready = torch.cuda.Event()
+                        ready.record(stream)
+                else:
+                    if ready is not None:
+                        torch.cuda.current_stream(self.device).wait_event(ready)
+                        ready = None
+                    result = stage.fn(item)
+            except Exception as e:
+                self.logger.error(
+                    "Error in stage '%s' for %s: %s",
+                    stage.name,
+                    self.label(item),
+                    str(e),
+                )
+                stats.drop()
+                continue
+            finally:
+                stats.add("busy", time.perf_counter() - start)
+
+            if is_last:
+                self._completed += 1
+            else:
+                start = time.perf_counter()
+                self._queues[index + 1].put((result, ready))
+                stats.add("wait_put", time.perf_counter() - start)
+
+    def run(self, items: Iterable[Any]) -> int:
+        """
+        Feed items through all stages and block until every item is done.
+
+        Returns:
+            Number of items that made it through the last stage
+        """
+        self._completed = 0
+        workers = [
+            threading.Thread(
+                target=self._worker,
+                args=(i,),
+                name=f"stage-{stage.name}",
+                daemon=True,
+            )
+            for i, stage in enumerate(self.stages)
+        ]
+        for worker in workers:
+            worker.start()
+
+        try:
+            for item in items:
+                self._queues[0].put((item, None))
+        finally:
+            self._queues[0].put(_STOP)
+            for worker in workers:
+                worker.join()
+
+        return self._completed
+
+    def occupancy(self) -> dict[str, dict[str, float]]:
+        """
+        Occupancy of the queue in front of each stage, and stage timings.
+
+        Queues fill up in front of the bottleneck and everything upstream of
+        it, and stay near 0 behind it, so the bottleneck is the last stage
+        whose queue is full. The timings say the same more directly: the
+        bottleneck has the largest "busy" time, stages before it wait on put
+        ("wait_put") and stages after it wait on get ("wait_get").
+        "dropped" counts the items the stage failed on.
+
+        Returns:
+            {stage name: {"current", "peak", "mean", "maxsize", "dropped",
+            "busy", "wait_get", "wait_put"}}, times in seconds
+        """
+        return {
+            stage.name: stats.as_dict(q.qsize())
+            for stage, q, stats in zip(self.stages, self._queues, self._stats)
+        }
+
+    def bottleneck(self) -> str:
+        """Name of the stage that spent the most time working."""
+        return max(self.occupancy().items(), key=lambda kv: kv[1]["busy"])[0]
+
+    def log_occupancy(self):
+        for name, stats in self.occupancy().items():
+            self.logger.info(
+                "Stage '%s': queue mean %.2f, peak %d / %d, "
+                "busy %.1fs, wait get %.1fs, wait put %.1fs, dropped %d",
+                name,
+                stats["mean"],
+                stats["peak"],
+                stats["maxsize"],
+                stats["busy"],
+                stats["wait_get"],
+                stats["wait_put"],
+                stats["dropped"],
+            )
+        self.logger.info("Bottleneck stage: %s", self.bottleneck())